@@ -1,84 +1,187 @@
 # backend/alerts.py
 
+import atexit
+import json
+import logging
 import os
+import queue
+import threading
 from datetime import datetime
 from typing import List, Optional
 
-# Ensure the alerts folder exists
+logger = logging.getLogger(__name__)
+
 ALERTS_FOLDER = "alerts"
-os.makedirs(ALERTS_FOLDER, exist_ok=True)
+ALERTS_LOG = os.path.join(ALERTS_FOLDER, "alerts.jsonl")
+
+# Writing reports to disk is opt-in: set PROTECTAI_PERSIST_ALERTS=1 to append
+# every alert/takedown to ALERTS_LOG from a background thread.
+PERSIST_ALERTS = os.environ.get("PROTECTAI_PERSIST_ALERTS", "0") == "1"
+
+
+def init_alerts_folder() -> None:
+    """Create the alerts folder. Call once at startup, not per request."""
+    os.makedirs(ALERTS_FOLDER, exist_ok=True)
+
+
+class _AlertWriter:
+    """
+    Single background thread appending records to ALERTS_LOG.
+
+    Records queued while a write is in flight are drained and written
+    together, so a burst of alerts costs one write() call. The log file is
+    opened up front so a bad path fails in the caller, not in the thread.
+    """
+
+    _STOP = None  # queue sentinel: write what is left, then exit
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._queue: "queue.Queue[Optional[dict]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="alert-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, record: dict) -> None:
+        self._queue.put(record)
+
+    def close(self) -> None:
+        """Write every queued record, then stop the thread and close the file."""
+        self._queue.put(self._STOP)
+        self._thread.join()
+
+    def _run(self) -> None:
+        try:
+            stopping = False
+            while not stopping:
+                records = [self._queue.get()]
+                while True:
+                    try:
+                        records.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if self._STOP in records:
+                    stopping = True
+                    records = [r for r in records if r is not self._STOP]
+                if not records:
+                    continue
+                payload = "".join(json.dumps(r) + "\n" for r in records)
+                try:
+                    os.write(self._fd, payload.encode("utf-8"))
+                except OSError:
+                    logger.exception("Failed to write %d alert record(s) to %s", len(records), self.path)
+        finally:
+            os.close(self._fd)
+
+
+_writer: Optional[_AlertWriter] = None
+_writer_lock = threading.Lock()
+
+
+def _persist(kind: str, image_file: str, timestamp: str, content: str) -> None:
+    """Queue a report for the background writer, starting it on first use."""
+    global _writer
+    writer = _writer
+    if writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = _AlertWriter(ALERTS_LOG)
+                atexit.register(shutdown_alerts)
+            writer = _writer
+    writer.submit({"type": kind, "image": image_file, "timestamp": timestamp, "content": content})
+
+
+def shutdown_alerts() -> None:
+    """Flush queued reports to disk and stop the background writer, if running."""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.close()
 
 
 def generate_alert(
-    image_file: str, 
-    prediction: str, 
-    confidence: float, 
-    matches: Optional[List[str]] = None
+    image_file: str,
+    prediction: str,
+    confidence: float,
+    matches: Optional[List[str]] = None,
+    persist: bool = PERSIST_ALERTS,
+    timestamp: Optional[str] = None,
 ) -> str:
     """
-    Generate a user-friendly alert report and save it to the alerts/ folder.
+    Generate a user-friendly alert report.
 
     Args:
         image_file (str): Name or path of the image analyzed.
         prediction (str): Deepfake prediction result.
         confidence (float): Confidence of the prediction (0.0 - 1.0).
         matches (List[str], optional): List of matched images or URLs.
+        persist (bool): Also append the report to alerts/alerts.jsonl
+            (asynchronously, in the background).
+        timestamp (str, optional): "%Y%m%d_%H%M%S" timestamp to stamp the
+            report with; pass the same value to related reports. Defaults to now.
 
     Returns:
-        str: Path to the saved alert file.
+        str: The alert report text.
     """
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    alert_filename = f"alert_{timestamp}.txt"
-    alert_path = os.path.join(ALERTS_FOLDER, alert_filename)
-
+    if timestamp is None:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     matches_text = ", ".join(matches) if matches else "None"
 
-    with open(alert_path, "w") as f:
-        f.write("==== ProtectAI Alert ====\n")
-        f.write(f"Image: {image_file}\n")
-        f.write(f"Deepfake Prediction: {prediction} (Confidence: {confidence:.2f})\n")
-        f.write(f"Matches Found: {matches_text}\n")
-        f.write(f"Timestamp: {timestamp}\n")
-        f.write("=========================\n")
+    content = (
+        "==== ProtectAI Alert ====\n"
+        f"Image: {image_file}\n"
+        f"Deepfake Prediction: {prediction} (Confidence: {confidence:.2f})\n"
+        f"Matches Found: {matches_text}\n"
+        f"Timestamp: {timestamp}\n"
+        "=========================\n"
+    )
 
-    return alert_path
+    if persist:
+        _persist("alert", image_file, timestamp, content)
+    return content
 
 
 def generate_takedown_request(
-    image_file: str, 
-    prediction: str, 
-    matches: Optional[List[str]] = None
+    image_file: str,
+    prediction: str,
+    matches: Optional[List[str]] = None,
+    persist: bool = PERSIST_ALERTS,
+    timestamp: Optional[str] = None,
 ) -> str:
     """
-    Generate a takedown request template for reporting misuse and save it.
+    Generate a takedown request template for reporting misuse.
 
     Args:
         image_file (str): Name or path of the image misused.
         prediction (str): Deepfake prediction result.
         matches (List[str], optional): List of matched images or URLs.
+        persist (bool): Also append the request to alerts/alerts.jsonl
+            (asynchronously, in the background).
+        timestamp (str, optional): "%Y%m%d_%H%M%S" timestamp to stamp the
+            report with; pass the same value to related reports. Defaults to now.
 
     Returns:
-        str: Path to the saved takedown request file.
+        str: The takedown request text.
     """
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    takedown_filename = f"takedown_{timestamp}.txt"
-    takedown_path = os.path.join(ALERTS_FOLDER, takedown_filename)
-
+    if timestamp is None:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     matches_text = ", ".join(matches) if matches else "None"
 
-    with open(takedown_path, "w") as f:
-        f.write("To: Abuse/Privacy Team\n")
-        f.write("Subject: Takedown Request - Misuse of Personal Image\n\n")
-        f.write("Dear Team,\n\n")
-        f.write(
-            f"I am writing to request the immediate removal of content that misuses my personal image ({image_file}).\n"
-        )
-        f.write(f"Detection Result: {prediction}\n")
-        if matches:
-            f.write(f"Matched Files: {matches_text}\n")
-        f.write(
-            "\nThis violates my privacy rights. Please take urgent action.\n\nSincerely,\nUser\n"
-        )
-        f.write(f"Timestamp: {timestamp}\n")
-
-    return takedown_path
+    lines = [
+        "To: Abuse/Privacy Team\n",
+        "Subject: Takedown Request - Misuse of Personal Image\n\n",
+        "Dear Team,\n\n",
+        f"I am writing to request the immediate removal of content that misuses my personal image ({image_file}).\n",
+        f"Detection Result: {prediction}\n",
+    ]
+    if matches:
+        lines.append(f"Matched Files: {matches_text}\n")
+    lines.append("\nThis violates my privacy rights. Please take urgent action.\n\nSincerely,\nUser\n")
+    lines.append(f"Timestamp: {timestamp}\n")
+    content = "".join(lines)
+
+    if persist:
+        _persist("takedown", image_file, timestamp, content)
+    return content
@@ -1,6 +1,14 @@
 # backend/db.py
-from sqlalchemy import create_engine, Column, Integer, String
-from sqlalchemy.orm import declarative_base, sessionmaker
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import (
+    create_engine, event, insert, inspect, select, text,
+    BigInteger, Column, Float, Integer, String,
+)
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
 from sqlalchemy.exc import IntegrityError
 
 # -----------------------------
@@ -10,6 +18,16 @@ DATABASE_URL = "sqlite:///protectai.db"
 
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL + synchronous=NORMAL: commits no longer fsync the main DB file each time."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
 Base = declarative_base()
 
 # -----------------------------
@@ -19,67 +37,237 @@ class Fingerprint(Base):
     __tablename__ = "fingerprints"
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, unique=True, index=True)
-    hash_value = Column(String, index=True)  # index added for faster lookup
+    hash_value = Column(BigInteger, index=True)  # 64-bit pHash as signed int; index added for faster lookup
+    mtime = Column(Float, nullable=True)  # source file mtime, lets dataset scans skip unchanged files
+    file_hash = Column(String, nullable=True, index=True)  # SHA256 of raw bytes, for exact dedup
+
+    @property
+    def hash_hex(self) -> str:
+        """The fingerprint as the 16-character hex string used by the API."""
+        return int_to_hash(self.hash_value)
+
+# -----------------------------
+# Hash encoding
+# -----------------------------
+def hash_to_int(hash_hex: str) -> int:
+    """64-bit hex fingerprint -> signed 64-bit int, as stored in hash_value."""
+    value = int(hash_hex, 16)
+    if not 0 <= value < 1 << 64:
+        raise ValueError(f"Not a 64-bit fingerprint: {hash_hex}")
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def int_to_hash(value: int) -> str:
+    """Stored (signed or unsigned) 64-bit int -> 16-character hex fingerprint."""
+    return f"{value & 0xFFFFFFFFFFFFFFFF:016x}"
+
+# load_hash_array() results per filename prefix. A write only evicts the
+# prefixes its filenames fall under, so e.g. uploads keep the dataset's array.
+_hash_cache: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+_hash_cache_lock = threading.Lock()
+_hash_cache_epoch = 0  # bumped on every write; loads racing a write aren't cached
+_deletion_epoch = 0  # bumped whenever rows are deleted or the table is reset
+
+def _invalidate_hash_cache(filenames: Optional[Iterable[str]] = None, deleted: bool = False):
+    """Evict cached prefixes covering any of filenames (all of them if None)."""
+    global _hash_cache_epoch, _deletion_epoch
+    with _hash_cache_lock:
+        _hash_cache_epoch += 1
+        if deleted or filenames is None:
+            _deletion_epoch += 1
+        if filenames is None:
+            _hash_cache.clear()
+            return
+        filenames = list(filenames)
+        for prefix in [p for p in _hash_cache if any(f.startswith(p) for f in filenames)]:
+            del _hash_cache[prefix]
 
 # -----------------------------
 # DB Utilities
 # -----------------------------
+def _migrate_hash_column():
+    """
+    Rebuild a fingerprints table that still stores hash_value as hex text.
+    64-bit hashes are converted to ints; anything else (e.g. legacy SHA256
+    fingerprints) is dropped and gets re-fingerprinted by the next dataset sync.
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table(Fingerprint.__tablename__):
+        return
+    columns = {c["name"]: c["type"] for c in inspector.get_columns(Fingerprint.__tablename__)}
+    if not isinstance(columns.get("hash_value"), String):
+        return
+
+    kept = [name for name in ("filename", "hash_value", "mtime", "file_hash") if name in columns]
+    with engine.begin() as conn:
+        rows = conn.execute(text(f"SELECT {', '.join(kept)} FROM {Fingerprint.__tablename__}")).mappings().all()
+        Fingerprint.__table__.drop(conn)
+        Fingerprint.__table__.create(conn)
+
+        converted = []
+        for row in rows:
+            try:
+                converted.append({**row, "hash_value": hash_to_int(row["hash_value"])})
+            except (TypeError, ValueError):
+                continue
+        if converted:
+            conn.execute(insert(Fingerprint), converted)
+
 def init_db(drop: bool = False):
     """Initialize database tables. Use drop=True to reset DB."""
     if drop:
         Base.metadata.drop_all(bind=engine)
+    else:
+        _migrate_hash_column()
     Base.metadata.create_all(bind=engine)
+    _invalidate_hash_cache()
 
-def save_fingerprint(filename: str, hash_value: str):
-    """Insert or update fingerprint entry."""
+@contextmanager
+def session_scope() -> Iterator[Session]:
+    """Yield a session, rolling back on error and closing it afterwards."""
     session = SessionLocal()
     try:
-        fp = Fingerprint(filename=filename, hash_value=hash_value)
-        session.add(fp)
-        session.commit()
-    except IntegrityError:
+        yield session
+    except Exception:
         session.rollback()
-        # Update existing record instead of failing
-        existing_fp = session.query(Fingerprint).filter_by(filename=filename).first()
-        if existing_fp:
-            existing_fp.hash_value = hash_value
-            session.commit()
+        raise
     finally:
         session.close()
 
-def get_fingerprints():
+@contextmanager
+def _use_session(session: Optional[Session]) -> Iterator[Session]:
+    """
+    Use the caller's (e.g. request-scoped) session, or an ephemeral one.
+    A failure rolls the caller's session back so its later calls still work.
+    """
+    if session is not None:
+        try:
+            yield session
+        except Exception:
+            session.rollback()
+            raise
+    else:
+        with session_scope() as ephemeral:
+            yield ephemeral
+
+def save_fingerprint(
+    filename: str,
+    hash_value: str,
+    mtime: Optional[float] = None,
+    file_hash: Optional[str] = None,
+    session: Optional[Session] = None,
+):
+    """Insert or update fingerprint entry (hash_value is the hex fingerprint)."""
+    hash_int = hash_to_int(hash_value)
+    with _use_session(session) as session:
+        try:
+            fp = Fingerprint(filename=filename, hash_value=hash_int, mtime=mtime, file_hash=file_hash)
+            session.add(fp)
+            session.commit()
+        except IntegrityError:
+            session.rollback()
+            # Update existing record instead of failing
+            existing_fp = session.query(Fingerprint).filter_by(filename=filename).first()
+            if existing_fp:
+                existing_fp.hash_value = hash_int
+                existing_fp.mtime = mtime
+                existing_fp.file_hash = file_hash
+                session.commit()
+    _invalidate_hash_cache([filename])
+
+def save_fingerprints_bulk(
+    entries: Iterable[Tuple[str, str, Optional[float]]],
+    session: Optional[Session] = None,
+):
+    """Insert or replace many (filename, hash_value, mtime) entries in one transaction."""
+    rows = [
+        {"filename": filename, "hash_value": hash_to_int(hash_value), "mtime": mtime}
+        for filename, hash_value, mtime in entries
+    ]
+    if not rows:
+        return
+
+    with _use_session(session) as session:
+        session.execute(insert(Fingerprint).prefix_with("OR REPLACE"), rows)
+        session.commit()
+    _invalidate_hash_cache(row["filename"] for row in rows)
+
+def get_fingerprints(session: Optional[Session] = None):
     """Fetch all fingerprints."""
-    session = SessionLocal()
-    try:
+    with _use_session(session) as session:
         return session.query(Fingerprint).all()
-    finally:
-        session.close()
 
-def get_fingerprint_by_filename(filename: str):
+def get_fingerprint_by_filename(filename: str, session: Optional[Session] = None):
     """Fetch single fingerprint by filename."""
-    session = SessionLocal()
-    try:
+    with _use_session(session) as session:
         return session.query(Fingerprint).filter_by(filename=filename).first()
-    finally:
-        session.close()
 
-def delete_fingerprint(filename: str) -> bool:
+def get_fingerprint_by_file_hash(file_hash: str, session: Optional[Session] = None):
+    """Fetch a fingerprint whose source file had exactly these bytes."""
+    with _use_session(session) as session:
+        return session.query(Fingerprint).filter_by(file_hash=file_hash).first()
+
+def find_by_hash(hash_value: str, prefix: str = "", session: Optional[Session] = None) -> List[str]:
+    """
+    Filenames whose fingerprint equals hash_value exactly (index seek on hash_value).
+    Use prefix to restrict results to one folder, e.g. the dataset.
+    """
+    query = select(Fingerprint.filename).where(Fingerprint.hash_value == hash_to_int(hash_value))
+    if prefix:
+        query = query.where(Fingerprint.filename.startswith(prefix, autoescape=True))
+    with _use_session(session) as session:
+        return list(session.execute(query).scalars().all())
+
+def deletion_epoch() -> int:
+    """
+    Counter that changes whenever rows are deleted (or the table is reset)
+    through this module, so callers can tell that what they last saw stored
+    may be gone.
+    """
+    return _deletion_epoch
+
+def load_hash_array(prefix: str = "", session: Optional[Session] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    All (filenames, uint64 hashes) as parallel read-only arrays, optionally
+    limited to a filename prefix. Cached until a write made through this
+    module touches a filename under that prefix (writes from other processes
+    are not seen).
+    """
+    with _hash_cache_lock:
+        cached = _hash_cache.get(prefix)
+        epoch = _hash_cache_epoch
+    if cached is not None:
+        return cached
+
+    query = select(Fingerprint.filename, Fingerprint.hash_value)
+    if prefix:
+        query = query.where(Fingerprint.filename.startswith(prefix, autoescape=True))
+    with _use_session(session) as session:
+        rows = session.execute(query).all()
+
+    names = np.array([filename for filename, _ in rows], dtype=object)
+    hashes = np.fromiter((h for _, h in rows), dtype=np.int64, count=len(rows)).view(np.uint64)
+    names.flags.writeable = False
+    hashes.flags.writeable = False
+
+    result = (names, hashes)
+    with _hash_cache_lock:
+        if epoch == _hash_cache_epoch:
+            _hash_cache[prefix] = result
+    return result
+
+def delete_fingerprint(filename: str, session: Optional[Session] = None) -> bool:
     """Delete a fingerprint by filename."""
-    session = SessionLocal()
-    try:
+    with _use_session(session) as session:
         fp = session.query(Fingerprint).filter_by(filename=filename).first()
         if fp:
             session.delete(fp)
             session.commit()
+            _invalidate_hash_cache([filename], deleted=True)
             return True
         return False
-    finally:
-        session.close()
 
-def count_fingerprints() -> int:
+def count_fingerprints(session: Optional[Session] = None) -> int:
     """Return total number of fingerprints stored."""
-    session = SessionLocal()
-    try:
+    with _use_session(session) as session:
         return session.query(Fingerprint).count()
-    finally:
-        session.close()
+
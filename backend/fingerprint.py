@@ -1,34 +1,51 @@
 # backend/fingerprint.py
 
 import hashlib
+import imagehash
 from PIL import Image
-import numpy as np
 from typing import Union
 
 
+def generate_fingerprint_from_pil(img: Image.Image, raise_error: bool = False) -> Union[str, None]:
+    """
+    Generate a perceptual fingerprint (64-bit pHash) of an already decoded image.
+
+    Unlike a cryptographic hash of the pixels, visually similar images get
+    fingerprints that differ in only a few bits, so near-duplicates can be
+    found by Hamming distance.
+
+    Args:
+        img (Image.Image): Decoded PIL image (any mode).
+        raise_error (bool): If True, raise exceptions instead of returning an error string.
+
+    Returns:
+        str: 16-character hex pHash of the image, or error message if failed.
+    """
+    try:
+        # pHash grayscales and downsizes internally before the DCT
+        fingerprint = str(imagehash.phash(img, hash_size=8))
+        return fingerprint
+
+    except Exception as e:
+        if raise_error:
+            raise
+        return f"Error generating fingerprint: {str(e)}"
+
+
 def generate_fingerprint(image_path: str, raise_error: bool = False) -> Union[str, None]:
     """
-    Generate a unique fingerprint (SHA256 hash) of an image based on its pixel values.
+    Open an image file and generate its perceptual fingerprint.
 
     Args:
         image_path (str): Path to the image file.
         raise_error (bool): If True, raise exceptions instead of returning an error string.
 
     Returns:
-        str: SHA256 hex digest of the image pixels, or error message if failed.
+        str: 16-character hex pHash of the image, or error message if failed.
     """
     try:
-        # Open image, convert to grayscale, normalize size
-        img = Image.open(image_path).convert("L")
-        img = img.resize((128, 128))
-        
-        # Convert pixels to bytes
-        pixels = np.array(img).flatten()
-        pixel_bytes = pixels.tobytes()
-        
-        # Generate SHA256 hash
-        fingerprint = hashlib.sha256(pixel_bytes).hexdigest()
-        return fingerprint
+        with Image.open(image_path) as img:
+            return generate_fingerprint_from_pil(img, raise_error=True)
 
     except Exception as e:
         if raise_error:
@@ -36,6 +53,28 @@ def generate_fingerprint(image_path: str, raise_error: bool = False) -> Union[st
         return f"Error generating fingerprint: {str(e)}"
 
 
+def generate_file_hash(image_path: str) -> str:
+    """
+    SHA256 of the raw file bytes, without decoding the image.
+
+    Identifies byte-identical uploads far faster than a pixel fingerprint;
+    use generate_fingerprint for similarity search.
+
+    Args:
+        image_path (str): Path to the image file.
+
+    Returns:
+        str: SHA256 hex digest of the file contents.
+    """
+    with open(image_path, "rb") as f:
+        if hasattr(hashlib, "file_digest"):  # Python 3.11+
+            return hashlib.file_digest(f, "sha256").hexdigest()
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+        return digest.hexdigest()
+
+
 # Optional test code
 if __name__ == "__main__":
     test_image = "uploads/test.jpg"
@@ -2,20 +2,24 @@
 
 import os
 import uuid
-import shutil
+import asyncio
 import logging
+from datetime import datetime
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import aiofiles
+from fastapi import Depends, FastAPI, UploadFile, File, HTTPException
 from fastapi.responses import JSONResponse
+from PIL import Image
+from sqlalchemy.orm import Session
 
 # backend/main.py
 
-from .fingerprint import generate_fingerprint
-from .search import search_image_in_dataset
-from .deepfake_detector import detect_deepfake
-from .alerts import generate_alert, generate_takedown_request
+from .fingerprint import generate_file_hash, generate_fingerprint_from_pil
+from .search import bootstrap_dataset, search_image_in_dataset
+from .deepfake_detector import BatchedDetector, load_model, preprocess
+from .alert import generate_alert, generate_takedown_request, init_alerts_folder, shutdown_alerts
 from . import db
 
 # --------------------------
@@ -27,30 +31,65 @@ logger = logging.getLogger("protectai")
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 UPLOAD_FOLDER = PROJECT_ROOT / "uploads"
 DATASET_FOLDER = PROJECT_ROOT / "dataset"
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB per read while streaming uploads to disk
 
 # --------------------------
 # FastAPI app
 # --------------------------
 app = FastAPI(title="ProtectAI", description="Agentic AI Security Assistant")
 
+# Shared micro-batching front end for the deepfake model (created at startup)
+detector: Optional[BatchedDetector] = None
+
 
 @app.on_event("startup")
-def startup_event():
+async def startup_event():
     """
     Ensure necessary folders and DB exist at startup.
     """
+    global detector
     UPLOAD_FOLDER.mkdir(parents=True, exist_ok=True)
-    (PROJECT_ROOT / "alerts").mkdir(parents=True, exist_ok=True)  # alerts module expects this
+    init_alerts_folder()
     (PROJECT_ROOT / "models").mkdir(parents=True, exist_ok=True)
     db.init_db()  # create tables if not present
+    # Index the dataset once; /analyze/ then only queries the DB
+    # (non-fatal: searches then run against whatever is already indexed)
+    try:
+        indexed = bootstrap_dataset(str(DATASET_FOLDER))
+        logger.info("Dataset bootstrap fingerprinted %d file(s)", indexed)
+    except Exception:
+        logger.exception("Dataset bootstrap failed")
+    # Load + compile before the first request if weights exist. Training (when
+    # they don't) and load errors are left to the first detection, which
+    # reports them through the usual {"error": ...} response.
+    try:
+        load_model(train_if_missing=False)
+    except Exception:
+        logger.exception("Deepfake model not loaded at startup")
+    detector = BatchedDetector()
     logger.info(f"Startup complete. Uploads: {UPLOAD_FOLDER}, Dataset: {DATASET_FOLDER}")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    if detector is not None:
+        await detector.close()
+    await asyncio.to_thread(shutdown_alerts)  # flush reports still queued
+
+
 @app.get("/")
 def home():
     return {"message": "Welcome to ProtectAI Security Assistant 🚀"}
 
 
+def get_session():
+    """
+    Request-scoped DB session: every DB helper used by one request shares it.
+    """
+    with db.session_scope() as session:
+        yield session
+
+
 def _safe_filename(original_filename: str) -> str:
     """
     Produce a safe, unique filename to avoid collisions and directory traversal.
@@ -60,23 +99,30 @@ def _safe_filename(original_filename: str) -> str:
     return unique
 
 
-def _save_upload_to_disk(upload_file: UploadFile, dest_path: Path) -> None:
+async def _save_upload_to_disk(upload_file: UploadFile, dest_path: Path) -> None:
     """
-    Save UploadFile to dest_path using stream (avoids loading entire file into memory).
+    Stream UploadFile to dest_path in chunks without blocking the event loop.
     """
     try:
-        with open(dest_path, "wb") as buffer:
-            shutil.copyfileobj(upload_file.file, buffer)
+        async with aiofiles.open(dest_path, "wb") as buffer:
+            while chunk := await upload_file.read(UPLOAD_CHUNK_SIZE):
+                await buffer.write(chunk)
     finally:
         # ensure the SpooledTemporaryFile is closed
         try:
-            upload_file.file.close()
+            await upload_file.close()
         except Exception:
             pass
 
 
+def _decode_image(path: Path) -> Image.Image:
+    """Open an image file and decode it to RGB."""
+    with Image.open(path) as img:
+        return img.convert("RGB")
+
+
 @app.post("/analyze/")
-async def analyze_image(file: UploadFile = File(...)):
+async def analyze_image(file: UploadFile = File(...), session: Session = Depends(get_session)):
     """
     Upload an image → fingerprint it → search dataset → run deepfake detection
     → generate alert & takedown if needed → return structured result.
@@ -90,26 +136,60 @@ async def analyze_image(file: UploadFile = File(...)):
 
     # Save file to disk
     try:
-        _save_upload_to_disk(file, file_location)
+        await _save_upload_to_disk(file, file_location)
     except Exception as e:
         logger.exception("Failed to save uploaded file")
         raise HTTPException(status_code=500, detail=f"Failed to save uploaded file: {e}")
 
-    # STEP 1: Generate fingerprint and store in DB
-    fingerprint = generate_fingerprint(str(file_location))
-    if isinstance(fingerprint, str) and fingerprint.startswith("Error"):
-        # fingerprint function returned an error string
-        logger.error("Fingerprinting error: %s", fingerprint)
-        raise HTTPException(status_code=500, detail=fingerprint)
+    # STEP 1: Check for a byte-identical earlier upload (same raw-file SHA256)
+    # before decoding. CPU/disk-bound steps run in worker threads so the event
+    # loop stays free.
+    file_hash = await asyncio.to_thread(generate_file_hash, str(file_location))
+    try:
+        existing = await asyncio.to_thread(db.get_fingerprint_by_file_hash, file_hash, session=session)
+    except Exception:
+        logger.exception("Failed to look up file hash in DB")
+        existing = None
 
+    # Decode once; fingerprinting and detection both reuse this image.
     try:
-        db.save_fingerprint(safe_name, fingerprint)
+        img_rgb = await asyncio.to_thread(_decode_image, file_location)
     except Exception as e:
-        logger.exception("Failed to save fingerprint to DB")
+        logger.exception("Failed to decode uploaded image")
+        raise HTTPException(status_code=400, detail=f"Invalid image file: {e}")
 
-    # STEP 2: Search dataset (local folder)
+    # Generate fingerprint and store in DB. Re-uploads reuse the stored row
+    # instead of adding a duplicate one, and their copy is not kept on disk.
+    if existing is not None:
+        fingerprint = existing.hash_hex
+        try:
+            await asyncio.to_thread(os.remove, file_location)
+        except OSError:
+            logger.exception("Failed to remove duplicate upload")
+    else:
+        fingerprint = await asyncio.to_thread(generate_fingerprint_from_pil, img_rgb)
+        if isinstance(fingerprint, str) and fingerprint.startswith("Error"):
+            # fingerprint function returned an error string
+            logger.error("Fingerprinting error: %s", fingerprint)
+            raise HTTPException(status_code=500, detail=fingerprint)
+
+        try:
+            await asyncio.to_thread(
+                db.save_fingerprint, safe_name, fingerprint, file_hash=file_hash, session=session
+            )
+        except Exception as e:
+            logger.exception("Failed to save fingerprint to DB")
+
+    # STEP 2: Search dataset (fingerprints indexed at startup, no folder scan)
     try:
-        search_result = search_image_in_dataset(str(file_location), dataset_folder=str(DATASET_FOLDER))
+        search_result = await asyncio.to_thread(
+            search_image_in_dataset,
+            fingerprint,
+            dataset_folder=str(DATASET_FOLDER),
+            session=session,
+            sync=False,
+            query_name=safe_name,
+        )
     except Exception as e:
         logger.exception("Dataset search failed")
         search_result = {"error": f"Dataset search failed: {str(e)}"}
@@ -125,7 +205,8 @@ async def analyze_image(file: UploadFile = File(...)):
 
     # STEP 3: Run deepfake detection
     try:
-        detection_result = detect_deepfake(str(file_location))
+        image_tensor = await asyncio.to_thread(preprocess, img_rgb)
+        detection_result = await detector.submit(image_tensor)
     except Exception as e:
         logger.exception("Deepfake detection failed")
         return JSONResponse(status_code=500, content={"error": f"Deepfake detection failed: {str(e)}"})
@@ -134,36 +215,43 @@ async def analyze_image(file: UploadFile = File(...)):
     if isinstance(detection_result, dict) and "error" in detection_result:
         logger.error("Detector error: %s", detection_result["error"])
         return JSONResponse(status_code=500, content=detection_result)
+    detection_result = {"file": safe_name, **detection_result}
 
     # STEP 4: Generate alert & takedown request (only if suspicious)
     # We consider suspicious if label says Fake or confidence is high enough.
     prediction = detection_result.get("prediction")
     confidence = detection_result.get("confidence")
 
+    # One timestamp for both reports so they always agree
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     try:
-        alert_path = generate_alert(
+        alert_text = generate_alert(
             image_file=safe_name,
             prediction=prediction,
             confidence=float(confidence) if confidence is not None else 0.0,
-            matches=matches_list
+            matches=matches_list,
+            timestamp=timestamp,
         )
-        takedown_path = generate_takedown_request(
+        takedown_text = generate_takedown_request(
             image_file=safe_name,
             prediction=prediction,
-            matches=matches_list
+            matches=matches_list,
+            timestamp=timestamp,
         )
     except Exception as e:
         logger.exception("Failed to generate alert/takedown")
-        alert_path = None
-        takedown_path = None
+        alert_text = None
+        takedown_text = None
 
     response = {
         "file": safe_name,
         "fingerprint": fingerprint,
+        "file_hash": file_hash,
+        "duplicate": existing is not None,
         "search_result": search_result,
         "deepfake_result": detection_result,
-        "alert_file": alert_path,
-        "takedown_request": takedown_path,
+        "alert": alert_text,
+        "takedown_request": takedown_text,
     }
 
     return JSONResponse(status_code=200, content=response)
\ No newline at end of file
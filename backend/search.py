@@ -1,42 +1,167 @@
 # backend/search.py
 
+import multiprocessing
 import os
-from typing import List, Dict
-from imagehash import hex_to_hash
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Optional, Tuple
+import numpy as np
 from backend.fingerprint import generate_fingerprint
+from backend import db
+from sqlalchemy.orm import Session
 
-# Optional: import your database interface if available
-# from backend import db  
+# Set-bit count of every byte value; popcounts uint64 hashes one byte lane at a time
+POPCOUNT_LUT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
 
+# Dataset fingerprinting is CPU-bound, so it fans out to worker processes.
+# The pool lives only for the duration of a sync that has files to hash, so
+# no idle workers linger afterwards. The lock keeps concurrent requests from
+# hashing the same new files twice.
+FINGERPRINT_WORKERS = os.cpu_count() or 1
+MAX_FINGERPRINT_CHUNKSIZE = 32  # files handed to a worker per round trip
+_sync_lock = threading.Lock()
 
-def search_image_in_dataset(image_path: str, dataset_folder: str = "dataset") -> Dict:
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+# Last synced {path: mtime} listing per dataset folder, with db.deletion_epoch()
+# at that time. An identical listing means the stored fingerprints are already
+# current, unless rows were deleted since (e.g. db.init_db(drop=True)).
+_dataset_listings: Dict[str, Tuple[int, Dict[str, float]]] = {}
+
+# {path: mtime} of dataset files that could not be fingerprinted; they are
+# retried only once their mtime changes
+_failed_fingerprints: Dict[str, float] = {}
+
+
+def sync_dataset_fingerprints(dataset_folder: str = "dataset", session: Optional[Session] = None) -> int:
     """
-    Search for exact fingerprint matches in a dataset folder.
+    Bring the stored fingerprints for a dataset folder up to date.
+
+    Only image files that are new or whose mtime changed since the last scan
+    are fingerprinted (in parallel worker processes); files that failed to
+    fingerprint are skipped until they change again. Rows for files that
+    disappeared from the folder are removed. If the folder listing is
+    unchanged since the previous call, the database is not touched at all.
 
     Args:
-        image_path (str): Path to the query image.
         dataset_folder (str): Path to dataset folder containing images.
+        session (Session, optional): DB session to reuse (e.g. request-scoped).
 
     Returns:
-        dict: Query filename and list of matches (or error message).
+        int: Number of files whose fingerprints were (re)stored.
+    """
+    with _sync_lock:
+        with os.scandir(dataset_folder) as entries:
+            listing = {
+                entry.path: entry.stat().st_mtime
+                for entry in entries
+                if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS)
+            }
+        if _dataset_listings.get(dataset_folder) == (db.deletion_epoch(), listing):
+            return 0
+
+        prefix = os.path.join(dataset_folder, "")
+        known = {
+            fp.filename: fp.mtime
+            for fp in db.get_fingerprints(session=session)
+            if fp.filename.startswith(prefix)
+        }
+
+        changed = [
+            (path, mtime)
+            for path, mtime in listing.items()
+            if known.get(path) != mtime and _failed_fingerprints.get(path) != mtime
+        ]
+        entries = []
+        if changed:
+            paths = [path for path, _ in changed]
+            workers = min(FINGERPRINT_WORKERS, len(paths))
+            # Large batches go out in chunks to cut IPC overhead; small ones
+            # stay fine-grained so every worker gets a share
+            chunksize = max(1, min(MAX_FINGERPRINT_CHUNKSIZE, len(paths) // (4 * workers)))
+            # "spawn" so workers never inherit a forked copy of the server's threads/CUDA state
+            with ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            ) as pool:
+                fingerprints = pool.map(generate_fingerprint, paths, chunksize=chunksize)
+                for (path, mtime), fingerprint in zip(changed, fingerprints):
+                    if fingerprint.startswith("Error"):
+                        _failed_fingerprints[path] = mtime
+                    else:
+                        _failed_fingerprints.pop(path, None)
+                        entries.append((path, fingerprint, mtime))
+            db.save_fingerprints_bulk(entries, session=session)
+
+        for stale in known.keys() - listing.keys():
+            db.delete_fingerprint(stale, session=session)
+
+        _dataset_listings[dataset_folder] = (db.deletion_epoch(), listing)
+        return len(entries)
+
+
+def bootstrap_dataset(dataset_folder: str = "dataset") -> int:
+    """
+    Fingerprint a dataset folder once, at application startup.
+
+    Hashing is spread over all CPU cores and stored with one bulk insert.
+    Files whose stored mtime still matches are skipped, so restarting
+    against an already indexed dataset costs only a directory scan.
+
+    Args:
+        dataset_folder (str): Path to dataset folder containing images.
+
+    Returns:
+        int: Number of files whose fingerprints were (re)stored.
     """
-    query_fingerprint = generate_fingerprint(image_path)
-    if "Error" in query_fingerprint:
-        return {"error": query_fingerprint}
+    if not os.path.isdir(dataset_folder):
+        return 0
+    return sync_dataset_fingerprints(dataset_folder)
+
+
+def search_image_in_dataset(
+    query_fingerprint: str,
+    dataset_folder: str = "dataset",
+    threshold: int = 5,
+    session: Optional[Session] = None,
+    sync: bool = True,
+    query_name: Optional[str] = None,
+) -> Dict:
+    """
+    Search a dataset folder for images perceptually similar to the query.
+
+    Dataset fingerprints are read from the database. threshold=0 is a single
+    indexed lookup on the hash; larger thresholds scan the cached uint64
+    hash array from db.load_hash_array().
 
+    Args:
+        query_fingerprint (str): pHash hex of the query image.
+        dataset_folder (str): Path to dataset folder containing images.
+        threshold (int): Maximum Hamming distance counted as a match.
+        session (Session, optional): DB session to reuse (e.g. request-scoped).
+        sync (bool): Refresh stored fingerprints from the folder first. Pass
+            False when the dataset was already indexed (e.g. at startup).
+        query_name (str, optional): Query filename to echo back as "query".
+
+    Returns:
+        dict: Query filename and list of matches (or error message).
+    """
     if not os.path.exists(dataset_folder):
         return {"error": f"Dataset folder '{dataset_folder}' not found."}
 
-    matches: List[str] = []
-    for file in os.listdir(dataset_folder):
-        file_path = os.path.join(dataset_folder, file)
-        if os.path.isfile(file_path):
-            dataset_fingerprint = generate_fingerprint(file_path)
-            if dataset_fingerprint == query_fingerprint:
-                matches.append(file)
+    if sync:
+        sync_dataset_fingerprints(dataset_folder, session=session)
+
+    prefix = os.path.join(dataset_folder, "")
+    if threshold == 0:
+        filenames = db.find_by_hash(query_fingerprint, prefix=prefix, session=session)
+        matches = sorted(os.path.basename(f) for f in filenames)
+    else:
+        names, hashes = db.load_hash_array(prefix, session=session)
+        similar = _similar_in_arrays(query_fingerprint, threshold, names, hashes)
+        matches = [os.path.basename(r["filename"]) for r in sorted(similar, key=lambda r: r["distance"])]
 
     return {
-        "query": os.path.basename(image_path),
+        "query": query_name,
         "matches": matches if matches else ["No matches found"]
     }
 
@@ -46,28 +171,45 @@ def search_similar(hash_value: str, threshold: int = 5, all_fingerprints: List[D
     Search for similar fingerprints using Hamming distance.
 
     Args:
-        hash_value (str): Query image fingerprint (SHA256 hex).
+        hash_value (str): Query image fingerprint (pHash hex).
         threshold (int): Maximum Hamming distance allowed (lower = stricter match).
         all_fingerprints (List[Dict], optional): List of dicts with {'filename', 'hash_value'}.
+            Defaults to every fingerprint stored in the database (cached
+            uint64 array, no per-call parsing).
 
     Returns:
         List[Dict]: List of matches with filename, hash, and distance.
     """
     if all_fingerprints is None:
-        # If db is available, replace this line with db.get_fingerprints()
-        all_fingerprints = []
+        names, hashes = db.load_hash_array()
+    else:
+        names = [fp["filename"] for fp in all_fingerprints]
+        hashes = np.fromiter(
+            (int(fp["hash_value"], 16) for fp in all_fingerprints),
+            dtype=np.uint64,
+            count=len(all_fingerprints),
+        )
+
+    return _similar_in_arrays(hash_value, threshold, names, hashes)
 
-    target_hash = hex_to_hash(hash_value)
-    results: List[Dict] = []
 
-    for fp in all_fingerprints:
-        db_hash = hex_to_hash(fp["hash_value"])
-        distance = target_hash - db_hash  # Hamming distance
-        if distance <= threshold:
-            results.append({
-                "filename": fp["filename"],
-                "hash": fp["hash_value"],
-                "distance": distance
-            })
-
-    return results
\ No newline at end of file
+def _similar_in_arrays(hash_value: str, threshold: int, names, hashes: np.ndarray) -> List[Dict]:
+    """Match a hex hash against parallel filename / uint64 hash arrays."""
+    if len(hashes) == 0:
+        return []
+
+    # XOR every stored hash against the query in one pass, then popcount the
+    # differing bits byte-wise through the lookup table
+    target = np.uint64(int(hash_value, 16))
+    xor = hashes ^ target
+    distances = POPCOUNT_LUT[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+    results: List[Dict] = []
+    for i in np.flatnonzero(distances <= threshold):
+        results.append({
+            "filename": names[i],
+            "hash": db.int_to_hash(int(hashes[i])),
+            "distance": int(distances[i])
+        })
+
+    return results
@@ -1,8 +1,10 @@
 # setup_sample_dataset.py
 import os
+import shutil
 import requests
 from PIL import Image
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 import time
 
 # Folders to create
@@ -28,17 +30,21 @@ FAKE_IMAGES = [
 ]
 
 HEADERS = {"User-Agent": "Mozilla/5.0 (compatible; ProtectAI/1.0)"}
+MAX_WORKERS = 8
 
 
-def download_image(url: str, dest_path: str, timeout: int = 15, retries: int = 1) -> bool:
+def download_image(
+    session: requests.Session, url: str, dest_path: str, timeout: int = 15, retries: int = 1
+) -> bool:
     """
     Download an image and validate it with Pillow before saving.
+    The shared session keeps connections alive across downloads.
     Returns True on success, False otherwise.
     """
     attempt = 0
     while attempt <= retries:
         try:
-            resp = requests.get(url, timeout=timeout, headers=HEADERS)
+            resp = session.get(url, timeout=timeout)
             resp.raise_for_status()
 
             # Quick content-size check
@@ -71,18 +77,26 @@ def download_image(url: str, dest_path: str, timeout: int = 15, retries: int = 1
     return False
 
 
-# Download real images
-for i, url in enumerate(REAL_IMAGES):
-    train_path = f"dataset/train/real/real_{i}.jpg"
-    val_path = f"dataset/val/real/real_val_{i}.jpg"
-    download_image(url, train_path)
-    download_image(url, val_path)
+def download_job(session: requests.Session, url: str, train_path: str, val_path: str) -> None:
+    """Download one image into train/ and mirror it into val/."""
+    if download_image(session, url, train_path):
+        shutil.copy(train_path, val_path)
+        print(f"✅ Copied {val_path}")
 
-# Download fake images
-for i, url in enumerate(FAKE_IMAGES):
-    train_path = f"dataset/train/fake/fake_{i}.jpg"
-    val_path = f"dataset/val/fake/fake_val_{i}.jpg"
-    download_image(url, train_path)
-    download_image(url, val_path)
 
-print("\nDataset setup complete. Check the `dataset/` folder.")
\ No newline at end of file
+# (url, train_path, val_path) for every sample image
+jobs = [
+    (url, f"dataset/train/real/real_{i}.jpg", f"dataset/val/real/real_val_{i}.jpg")
+    for i, url in enumerate(REAL_IMAGES)
+] + [
+    (url, f"dataset/train/fake/fake_{i}.jpg", f"dataset/val/fake/fake_val_{i}.jpg")
+    for i, url in enumerate(FAKE_IMAGES)
+]
+
+# Download concurrently over one pooled, keep-alive session
+with requests.Session() as session:
+    session.headers.update(HEADERS)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        list(executor.map(lambda job: download_job(session, *job), jobs))
+
+print("\nDataset setup complete. Check the `dataset/` folder.")
@@ -13,8 +13,11 @@ import time
 # -------------------------------
 # 1. Training Config
 # -------------------------------
-DATA_DIR = "dataset"  # must have subfolders: dataset/train/real, dataset/train/fake
-MODEL_SAVE_PATH = "deepfake_model.pth"
+# Paths are relative to the project root, the same place the API reads from
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(PROJECT_ROOT, "dataset")  # must have subfolders: dataset/train/real, dataset/train/fake
+MODEL_SAVE_PATH = os.path.join(PROJECT_ROOT, "models", "deepfake_model.pth")
+METADATA_PATH = os.path.join(PROJECT_ROOT, "models", "model_metadata.json")
 BATCH_SIZE = 8
 EPOCHS = 3  # keep low for testing
 LEARNING_RATE = 0.001
@@ -28,10 +31,10 @@ def setup_sample_dataset():
     print("⚠️ No dataset found. Downloading a small sample dataset...")
 
     folders = [
-        "dataset/train/real",
-        "dataset/train/fake",
-        "dataset/val/real",
-        "dataset/val/fake",
+        os.path.join(DATA_DIR, "train", "real"),
+        os.path.join(DATA_DIR, "train", "fake"),
+        os.path.join(DATA_DIR, "val", "real"),
+        os.path.join(DATA_DIR, "val", "fake"),
     ]
     for f in folders:
         os.makedirs(f, exist_ok=True)
@@ -60,13 +63,13 @@ def setup_sample_dataset():
 
     # Download reals
     for url, name in real_images:
-        download(url, f"dataset/train/real/{name}")
-        download(url, f"dataset/val/real/val_{name}")
+        download(url, os.path.join(DATA_DIR, "train", "real", name))
+        download(url, os.path.join(DATA_DIR, "val", "real", f"val_{name}"))
 
     # Download fakes
     for url, name in fake_images:
-        download(url, f"dataset/train/fake/{name}")
-        download(url, f"dataset/val/fake/val_{name}")
+        download(url, os.path.join(DATA_DIR, "train", "fake", name))
+        download(url, os.path.join(DATA_DIR, "val", "fake", f"val_{name}"))
 
 
 # Check dataset
@@ -80,6 +83,8 @@ if not os.path.exists(os.path.join(DATA_DIR, "train")):
 transform = transforms.Compose([
     transforms.Resize((224, 224)),
     transforms.ToTensor(),
+    transforms.Normalize(mean=[0.485, 0.456, 0.406],
+                         std=[0.229, 0.224, 0.225]),
 ])
 
 train_dataset = datasets.ImageFolder(os.path.join(DATA_DIR, "train"), transform=transform)
@@ -142,7 +147,11 @@ def train() -> float:
         print(f"📚 Epoch {epoch+1}/{EPOCHS}, Loss: {running_loss/len(train_loader):.4f}, Train Acc: {final_train_acc:.2f}%")
         validate()
 
-    torch.save(model.state_dict(), MODEL_SAVE_PATH)
+    # Write then rename, so the API never sees a half-written weights file
+    os.makedirs(os.path.dirname(MODEL_SAVE_PATH), exist_ok=True)
+    tmp_path = MODEL_SAVE_PATH + ".tmp"
+    torch.save(model.state_dict(), tmp_path)
+    os.replace(tmp_path, MODEL_SAVE_PATH)
     print(f"✅ Model saved as {MODEL_SAVE_PATH}")
     return final_train_acc
 
@@ -156,6 +165,6 @@ if __name__ == "__main__":
         "epochs": EPOCHS,
         "final_train_acc": round(final_train_acc, 2),
     }
-    with open("model_metadata.json", "w") as f:
+    with open(METADATA_PATH, "w") as f:
         json.dump(metadata, f)
-    print("📝 Training metadata saved as model_metadata.json")
\ No newline at end of file
+    print(f"📝 Training metadata saved as {METADATA_PATH}")
\ No newline at end of file